@@ -19,23 +19,63 @@ necessary and listen on port 5000.
 
 from __future__ import annotations
 
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, make_response, send_file, send_from_directory, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import column_property, joinedload, selectinload, undefer
 from werkzeug.utils import secure_filename
+import csv
+import functools
 import os
-from datetime import datetime
+import re
+import threading
+import time
+from collections import OrderedDict
+from calendar import monthrange
+from datetime import date, datetime
 from typing import Any, Dict
 from xml.etree import ElementTree
 from PyPDF2 import PdfReader
 import io
-import pandas as pd
+import orjson
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 # Use the pure-Python fpdf2 library to generate PDF summaries without requiring
 # native compilation, which improves compatibility across environments.
 from fpdf import FPDF
 
+
+class ORJSONProvider(JSONProvider):
+    """Serialize JSON responses with orjson instead of the stdlib encoder.
+
+    orjson encodes several times faster and handles date/datetime values
+    natively. Keys are sorted, as with Flask's default provider, and non-string
+    keys are allowed.
+    """
+
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, option=self._OPTIONS).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # Hand orjson's bytes straight to the response instead of going through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self._OPTIONS), mimetype="application/json"
+        )
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 # Directory to store uploaded documents
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -46,6 +86,47 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
 db = SQLAlchemy(app)
 
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune every new SQLite connection for concurrent reads and fast commits.
+
+    WAL lets readers (document listing, analytics) proceed while an upload is
+    writing, and synchronous=NORMAL only fsyncs at checkpoints instead of on
+    every commit. WAL is skipped for in-memory databases, which do not
+    support it.
+    """
+    cursor = dbapi_connection.cursor()
+    if not _SQLITE_IN_MEMORY:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=10737418240")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+    # pysqlite's legacy transaction handling emits no BEGIN before a
+    # SAVEPOINT, so every RELEASE would commit on its own. Turn it off and let
+    # _begin_sqlite_transaction start transactions explicitly instead.
+    dbapi_connection.isolation_level = None
+
+
+def _begin_sqlite_transaction(connection) -> None:
+    """Emit BEGIN whenever SQLAlchemy starts a transaction.
+
+    Together with isolation_level = None this is SQLAlchemy's documented
+    pysqlite workaround: savepoints then nest inside one real transaction, so
+    an upload's per-file SAVEPOINTs are committed together, once, at the end.
+    """
+    connection.exec_driver_sql("BEGIN")
+
+
+# Register the pragmas before any connection is opened (and thus before
+# create_tables runs) so the WAL file is set up once for the database.
+with app.app_context():
+    _SQLITE_IN_MEMORY = db.engine.url.database in (None, "", ":memory:")
+    event.listen(db.engine, "connect", _set_sqlite_pragmas)
+    event.listen(db.engine, "begin", _begin_sqlite_transaction)
+
 # Enable CORS for API routes. In Flask-CORS 4.x the default no longer allows all origins.
 # We allow any origin (including 'null' file origins) and support credentials. The
 # send_wildcard option instructs Flask-CORS to echo '*' in the Access-Control-Allow-Origin
@@ -56,22 +137,128 @@ db = SQLAlchemy(app)
 # that supports_credentials cannot be used with '*' origins.
 CORS(app, resources={r"/api/*": {"origins": "*"}}, send_wildcard=True)
 
+# ---------------------------------------------------------------------------
+# Response cache for read-only endpoints (document listing, dashboard,
+# analytics). Results are kept per view and query string, expire after a few
+# minutes and are dropped whenever documents are added or removed. At most
+# RESPONSE_CACHE_MAX_ENTRIES results are kept, evicting the least recently
+# used, so free-text searches and paging combinations cannot grow it without
+# bound. The cache is local to the process; with several workers, a worker that did not handle
+# the write may serve stale results until the TTL expires.
+#
+# Cached responses also carry an ETag built from a per-process token and a
+# data version bumped on every invalidation, so polling clients get a 304
+# without a body while nothing has changed.
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_MAX_ENTRIES = 256
+_response_cache: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+_response_cache_lock = threading.Lock()
+_CACHE_EPOCH = os.urandom(4).hex()
+_data_version = 0
+
+
+def cached_view(view=None, *, vary=None):
+    """Cache a view's return value keyed by view name and query string.
+
+    The cached value is handed out again on every hit, so views must return
+    plain data (dicts, bytes, tuples) rather than a Response object.
+
+    ``vary`` is an optional callable for views whose output depends on more
+    than the stored documents (e.g. the current date); its result is added to
+    both the cache key and the ETag.
+    """
+    if view is None:
+        return functools.partial(cached_view, vary=vary)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        extra = vary() if vary is not None else None
+        # The tag describes the data version read before computing: if an
+        # upload commits meanwhile, the client just revalidates to a 200
+        etag = f"{_CACHE_EPOCH}-{_data_version}"
+        if extra is not None:
+            etag = f"{etag}-{extra}"
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        result = _cached(
+            (view.__name__, request.query_string, extra), lambda: view(*args, **kwargs)
+        )
+        response = make_response(result)
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return wrapper
+
+
+def cached_call(func):
+    """Cache a helper's return value keyed by its positional arguments.
+
+    Shares the storage, TTL and invalidation of :func:`cached_view`, for
+    results needed by more than one endpoint. Callers must not mutate the
+    returned value.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        return _cached((func.__name__, *args), lambda: func(*args))
+    return wrapper
+
+
+def _cached(key: tuple, compute):
+    """Return the cached value for ``key``, computing and storing it when missing or expired.
+
+    A result is only stored if no invalidation happened while it was being
+    computed; otherwise it may predate the write and is returned uncached.
+    """
+    version = _data_version
+    now = time.monotonic()
+    with _response_cache_lock:
+        hit = _response_cache.get(key)
+        if hit is not None and hit[0] > now:
+            _response_cache.move_to_end(key)
+            return hit[1]
+    result = compute()
+    with _response_cache_lock:
+        # Checked under the lock, which invalidation also holds
+        if _data_version == version:
+            # Drop expired entries, then the least recently used over the cap
+            for stale in [k for k, (expires, _) in _response_cache.items() if expires <= now]:
+                del _response_cache[stale]
+            _response_cache[key] = (now + RESPONSE_CACHE_TTL, result)
+            while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+                _response_cache.popitem(last=False)
+    return result
+
+
+def invalidate_response_cache() -> None:
+    """Drop all cached responses and bump the data version after documents change."""
+    global _data_version
+    with _response_cache_lock:
+        _data_version += 1
+        _response_cache.clear()
+
+
 # ---------------------------------------------------------------------------
 # Utility function to clear all documents and related data
 def _delete_all_documents() -> None:
     """Remove all records from the database and delete uploaded files."""
-    # Remove uploaded files
-    docs = Document.query.all()
-    for doc in docs:
+    # Remove uploaded files. Only the names are needed, and documents coming
+    # from the same DTE envelope share a single file.
+    filenames = db.session.execute(select(Document.filename).distinct()).scalars().all()
+    for filename in filenames:
         try:
-            os.remove(os.path.join(app.config["UPLOAD_FOLDER"], doc.filename))
+            os.remove(os.path.join(app.config["UPLOAD_FOLDER"], filename))
         except FileNotFoundError:
             pass
-    # Clear tables
-    db.session.query(Item).delete()
-    db.session.query(Document).delete()
-    db.session.query(Supplier).delete()
+    # Clear tables with bulk DELETE statements in a single transaction
+    db.session.execute(delete(Item))
+    db.session.execute(delete(Document))
+    db.session.execute(delete(Supplier))
+    db.session.execute(delete(DocumentStats))
+    db.session.execute(delete(ProductMonthStats))
     db.session.commit()
+    invalidate_response_cache()
 
 
 
@@ -81,7 +268,8 @@ class Supplier(db.Model):
     __tablename__ = "suppliers"
     id = db.Column(db.Integer, primary_key=True)
     rut = db.Column(db.String(20), unique=True, nullable=False)
-    name = db.Column(db.String(255), nullable=False)
+    # Indexed for the supplier-name filter and the name-ordered listing
+    name = db.Column(db.String(255), nullable=False, index=True)
     documents = db.relationship("Document", back_populates="supplier")
 
     def as_dict(self) -> Dict[str, Any]:
@@ -92,6 +280,19 @@ class Document(db.Model):
     """Represents an uploaded document (PDF or XML) or DTE envelope."""
 
     __tablename__ = "documents"
+    __table_args__ = (
+        # Date range + supplier filters used by the listing and analytics
+        db.Index("ix_documents_doc_date_supplier", "doc_date", "supplier_id"),
+        db.Index("ix_documents_invoice_number", "invoice_number"),
+        # Per-supplier document counts (analytics providers_usage), and
+        # supplier filters combined with a date range: the planner prefers the
+        # supplier equality, and with doc_date second the range is searched
+        # in the same index instead of checked row by row
+        db.Index("ix_documents_supplier_date", "supplier_id", "doc_date"),
+        # Listing order (upload_date DESC, id DESC), walked backwards so a
+        # paged listing stops after `limit` rows instead of sorting them all
+        db.Index("ix_documents_upload_date", "upload_date", "id"),
+    )
 
     id: int = db.Column(db.Integer, primary_key=True)
     filename: str = db.Column(db.String(255), nullable=False)
@@ -109,8 +310,18 @@ class Document(db.Model):
     # Relationships/foreign keys
     supplier_id = db.Column(db.Integer, db.ForeignKey("suppliers.id"), nullable=True)
     doc_date = db.Column(db.Date, nullable=True)  # Date of the document (e.g., FchEmis)
-    supplier = db.relationship("Supplier", back_populates="documents")
-    items = db.relationship("Item", back_populates="document", cascade="all, delete-orphan")
+    # doc_date as "YYYY-MM", kept in sync by _set_doc_month. Monthly rollups
+    # group on this indexed column instead of strftime(doc_date).
+    doc_month = db.Column(db.String(7), nullable=True, index=True)
+    # lazy="raise": every query that reads the supplier must load it eagerly
+    # (joinedload), so an accidental per-row lazy load fails loudly instead of
+    # silently turning into N+1 queries
+    supplier = db.relationship("Supplier", back_populates="documents", lazy="raise")
+    # Explicit order: line items keep the order they appear in the DTE rather
+    # than whatever order the chosen index returns them in
+    items = db.relationship(
+        "Item", back_populates="document", cascade="all, delete-orphan", order_by="Item.id"
+    )
 
     def as_dict(self) -> Dict[str, Any]:
         """
@@ -126,8 +337,9 @@ class Document(db.Model):
             "pages": self.pages,
             "xml_root": self.xml_root,
             "size_bytes": self.size_bytes,
-            "upload_date": self.upload_date.isoformat(),
-            "doc_date": self.doc_date.isoformat() if self.doc_date else None,
+            # Dates are serialized to ISO 8601 by ORJSONProvider
+            "upload_date": self.upload_date,
+            "doc_date": self.doc_date,
             "invoice_number": self.invoice_number,
             "invoice_address": self.invoice_address,
         }
@@ -135,21 +347,102 @@ class Document(db.Model):
         if self.supplier:
             data["supplier_rut"] = self.supplier.rut
             data["supplier_name"] = self.supplier.name
-        # Compute invoice total by summing item totals or quantity*price
-        total_value = 0.0
-        for itm in self.items:
-            if itm.total is not None:
-                total_value += float(itm.total)
-            elif itm.quantity is not None and itm.price is not None:
-                total_value += float(itm.quantity) * float(itm.price)
-        data["invoice_total"] = total_value
+        # Invoice total is aggregated by the database (see Document.invoice_total)
+        data["invoice_total"] = float(self.invoice_total or 0)
         return data
 
 
+@event.listens_for(Document, "before_insert")
+@event.listens_for(Document, "before_update")
+def _set_doc_month(mapper, connection, target: Document) -> None:
+    """Derive doc_month from doc_date whenever a document is written."""
+    target.doc_month = target.doc_date.strftime("%Y-%m") if target.doc_date else None
+
+
+# File size buckets of the dashboard histogram as (label, inclusive upper
+# bound in bytes); the last bucket is open-ended
+DASHBOARD_SIZE_BUCKETS = [
+    ("0-100 KB", 100 * 1024),
+    ("100-500 KB", 500 * 1024),
+    ("500-1000 KB", 1000 * 1024),
+    (">1000 KB", None),
+]
+
+
+def _size_bucket(size_bytes: int) -> int:
+    """Return the index of the DASHBOARD_SIZE_BUCKETS entry a file size falls in."""
+    for i, (_, upper) in enumerate(DASHBOARD_SIZE_BUCKETS):
+        if upper is None or size_bytes <= upper:
+            return i
+    return len(DASHBOARD_SIZE_BUCKETS) - 1
+
+
+class DocumentStats(db.Model):
+    """Running document totals per file type, month, supplier and size bucket.
+
+    Maintained by _update_document_stats as documents are inserted, so the
+    dashboard reads a handful of summary rows instead of scanning documents.
+    Missing months and suppliers are stored as "" and 0 rather than NULL,
+    because NULLs never compare equal in the primary key and would defeat the
+    upsert.
+    """
+
+    __tablename__ = "document_stats"
+    filetype = db.Column(db.String(10), primary_key=True)
+    doc_month = db.Column(db.String(7), primary_key=True)
+    supplier_id = db.Column(db.Integer, primary_key=True)
+    size_bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_size = db.Column(db.Integer, nullable=False, default=0)
+    # Page totals only count PDFs whose page count could be read
+    pdf_pages_sum = db.Column(db.Integer, nullable=False, default=0)
+    pdf_pages_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+@event.listens_for(Document, "after_insert")
+def _update_document_stats(mapper, connection, target: Document) -> None:
+    """Add a newly inserted document to its DocumentStats row.
+
+    Runs on the flush connection, so the upsert belongs to the same
+    transaction (and savepoint) as the document itself.
+    """
+    has_pages = target.filetype == "pdf" and target.pages is not None
+    pages = target.pages if has_pages else 0
+    pages_count = 1 if has_pages else 0
+    stmt = sqlite_insert(DocumentStats).values(
+        filetype=target.filetype,
+        doc_month=target.doc_month or "",
+        supplier_id=target.supplier_id or 0,
+        size_bucket=_size_bucket(target.size_bytes),
+        count=1,
+        total_size=target.size_bytes,
+        pdf_pages_sum=pages,
+        pdf_pages_count=pages_count,
+    )
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["filetype", "doc_month", "supplier_id", "size_bucket"],
+            set_={
+                "count": DocumentStats.count + 1,
+                "total_size": DocumentStats.total_size + target.size_bytes,
+                "pdf_pages_sum": DocumentStats.pdf_pages_sum + pages,
+                "pdf_pages_count": DocumentStats.pdf_pages_count + pages_count,
+            },
+        )
+    )
+
+
 class Item(db.Model):
     """Represents an item (product) extracted from a document."""
 
     __tablename__ = "items"
+    __table_args__ = (
+        # Join key for every Item -> Document aggregate; name is included so
+        # per-product GROUP BYs can be answered from the index
+        db.Index("ix_items_document_id_name", "document_id", "name"),
+        # Distinct product listing and per-product lookups by name
+        db.Index("ix_items_name", "name"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey("documents.id"), nullable=False)
     name = db.Column(db.String(255), nullable=False)
@@ -169,17 +462,126 @@ class Item(db.Model):
         }
 
 
+# Invoice total computed in SQL by summing item totals, falling back to
+# quantity * price for lines without an explicit total. It is deferred so it
+# only runs where requested, e.g. with undefer() in list queries.
+Document.invoice_total = column_property(
+    select(
+        db.func.coalesce(
+            db.func.sum(db.func.coalesce(Item.total, Item.quantity * Item.price)), 0
+        )
+    )
+    .where(Item.document_id == Document.id)
+    .correlate_except(Item)
+    .scalar_subquery(),
+    deferred=True,
+)
+
+
+class ProductMonthStats(db.Model):
+    """Running line-item totals per product name and document month.
+
+    Updated by _add_product_month_stats when an upload inserts its items, so
+    the analytics summaries read one row per product and month instead of
+    joining every item to its document. Documents without a month are stored
+    under "" so the upsert key never contains NULL.
+    """
+
+    __tablename__ = "product_month_stats"
+    name = db.Column(db.String(255), primary_key=True)
+    doc_month = db.Column(db.String(7), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    total_qty = db.Column(db.Float, nullable=False, default=0)
+    # Price aggregates skip lines without a price, like SQL MIN/MAX/AVG do
+    min_price = db.Column(db.Float, nullable=True)
+    max_price = db.Column(db.Float, nullable=True)
+    price_sum = db.Column(db.Float, nullable=False, default=0)
+    price_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+def _add_product_month_stats(document_ids: list[int]) -> None:
+    """Fold the items of newly inserted documents into ProductMonthStats.
+
+    Aggregates the new items per product and month in SQL and upserts the
+    result, within the caller's transaction. Items are bulk-inserted without
+    mapper events, so this is called explicitly after the insert.
+    """
+    month = db.func.coalesce(Document.doc_month, "")
+    new_totals = (
+        select(
+            Item.name,
+            month,
+            db.func.count(Item.id),
+            db.func.coalesce(db.func.sum(Item.quantity), 0),
+            db.func.min(Item.price),
+            db.func.max(Item.price),
+            db.func.coalesce(db.func.sum(Item.price), 0),
+            db.func.count(Item.price),
+        )
+        .join(Document, Document.id == Item.document_id)
+        .where(Item.document_id.in_(document_ids))
+        .group_by(Item.name, month)
+    )
+    stmt = sqlite_insert(ProductMonthStats).from_select(
+        ["name", "doc_month", "item_count", "total_qty", "min_price", "max_price",
+         "price_sum", "price_count"],
+        new_totals,
+    )
+    new = stmt.excluded
+    # Two-argument min()/max() are scalar in SQLite and return NULL if either
+    # side is NULL; coalesce then keeps whichever side has a price
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["name", "doc_month"],
+            set_={
+                "item_count": ProductMonthStats.item_count + new.item_count,
+                "total_qty": ProductMonthStats.total_qty + new.total_qty,
+                "min_price": db.func.coalesce(
+                    db.func.min(ProductMonthStats.min_price, new.min_price),
+                    ProductMonthStats.min_price,
+                    new.min_price,
+                ),
+                "max_price": db.func.coalesce(
+                    db.func.max(ProductMonthStats.max_price, new.max_price),
+                    ProductMonthStats.max_price,
+                    new.max_price,
+                ),
+                "price_sum": ProductMonthStats.price_sum + new.price_sum,
+                "price_count": ProductMonthStats.price_count + new.price_count,
+            },
+        )
+    )
+
+
 def create_tables() -> None:
     """Create the database tables at start up.
 
-    For simplicity in this demo, we drop all existing tables and recreate them to
-    apply schema changes. In a production application, use a migration tool
-    like Alembic instead of dropping data.
+    Only missing tables are created, so existing data survives restarts.
+    create_all does not alter tables that already exist: after a schema change,
+    start once with RESET_DB=1 to drop and recreate everything (this erases
+    data). In a production application, use a migration tool like Alembic
+    instead of dropping data.
     """
     with app.app_context():
-        # Drop existing tables (if any) and recreate them. This will erase data.
-        db.drop_all()
+        if os.environ.get("RESET_DB") == "1":
+            db.drop_all()
         db.create_all()
+        _backfill_product_month_stats()
+
+
+def _backfill_product_month_stats() -> None:
+    """Fill an empty ProductMonthStats table from the items already stored.
+
+    The rollup is derived data: a database created before the table existed
+    gets it rebuilt at start up instead of analytics reporting nothing.
+    """
+    if db.session.execute(select(ProductMonthStats.name).limit(1)).first() is not None:
+        return
+    document_ids = db.session.execute(select(Item.document_id).distinct()).scalars().all()
+    # Batched to stay well below SQLite's bound-parameter limit
+    for start in range(0, len(document_ids), 500):
+        _add_product_month_stats(document_ids[start:start + 500])
+    db.session.commit()
 
 
 def extract_document_metadata(filepath: str, filetype: str) -> Dict[str, Any]:
@@ -190,20 +592,195 @@ def extract_document_metadata(filepath: str, filetype: str) -> Dict[str, Any]:
     metadata: Dict[str, Any] = {"pages": None, "xml_root": None}
     if filetype.lower() == "pdf":
         try:
-            reader = PdfReader(filepath)
-            metadata["pages"] = len(reader.pages)
+            # Read the page count from the catalog's page tree root instead of
+            # len(reader.pages), which flattens and loads every page object.
+            reader = PdfReader(filepath, strict=False)
+            metadata["pages"] = int(reader.trailer["/Root"]["/Pages"]["/Count"])
         except Exception:
             metadata["pages"] = None
     elif filetype.lower() == "xml":
         try:
-            tree = ElementTree.parse(filepath)
-            metadata["xml_root"] = tree.getroot().tag
+            # Only the root tag is needed: stop at the first start event
+            # instead of building the whole tree.
+            for _, elem in ElementTree.iterparse(filepath, events=("start",)):
+                metadata["xml_root"] = elem.tag
+                break
         except Exception:
             metadata["xml_root"] = None
     return metadata
 
 
+# Fully qualified tag names of the SII (Servicio de Impuestos Internos) DTE
+# schema. Comparing element tags against these avoids resolving a namespace
+# prefix on every lookup.
+SII = '{http://www.sii.cl/SiiDte}'
+DTE_TAG = SII + 'DTE'
+ENCABEZADO = SII + 'Encabezado'
+DETALLE = SII + 'Detalle'
+# Encabezado sections whose direct children hold the fields we extract
+DTE_HEADER_SECTIONS = frozenset({SII + 'Emisor', SII + 'IdDoc', SII + 'Receptor'})
+RUT_EMISOR = SII + 'RUTEmisor'
+RZN_SOC = SII + 'RznSoc'
+RZN_SOC_EMISOR = SII + 'RznSocEmisor'
+FCH_EMIS = SII + 'FchEmis'
+FOLIO = SII + 'Folio'
+DIR_RECEP = SII + 'DirRecep'
+DIR_DEST = SII + 'DirDest'
+NMB_ITEM = SII + 'NmbItem'
+QTY_ITEM = SII + 'QtyItem'
+PRC_ITEM = SII + 'PrcItem'
+MONTO_ITEM = SII + 'MontoItem'
+
+
+_NUM_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def _to_float(text: str | None) -> float | None:
+    """Convert a numeric XML field to float, returning None for empty or invalid text."""
+    if not text:
+        return None
+    text = text.strip()
+    return float(text) if _NUM_RE.fullmatch(text) else None
+
+
+def _parse_dte(dte: ElementTree.Element) -> Dict[str, Any]:
+    """Extract supplier, invoice header fields and line items from one DTE element.
+
+    The element is walked once following the schema layout (DTE > Documento >
+    Encabezado / Detalle) instead of running a descendant search per field.
+    Returns a plain dict so the element can be discarded right after parsing.
+    """
+    header: Dict[str, str | None] = {}
+    items = []
+    # Children of the DTE are the document body (Documento, Liquidacion or
+    # Exportaciones) and its signature
+    for body in dte:
+        for section in body:
+            if section.tag == DETALLE:
+                fields = {child.tag: child.text for child in section}
+                items.append({
+                    "name": fields.get(NMB_ITEM) or '',
+                    "quantity": _to_float(fields.get(QTY_ITEM)),
+                    "price": _to_float(fields.get(PRC_ITEM)),
+                    "total": _to_float(fields.get(MONTO_ITEM)),
+                })
+            elif section.tag == ENCABEZADO:
+                for part in section:
+                    if part.tag in DTE_HEADER_SECTIONS:
+                        for child in part:
+                            header.setdefault(child.tag, child.text)
+    # Supplier info. Some DTE documents use different tag names
+    rut_emisor = header.get(RUT_EMISOR)
+    nombre_emisor = header.get(RZN_SOC) or header.get(RZN_SOC_EMISOR)
+    # Invoice date
+    doc_date = None
+    date_text = header.get(FCH_EMIS)
+    if date_text:
+        try:
+            doc_date = datetime.strptime(date_text, '%Y-%m-%d').date()
+        except Exception:
+            doc_date = None
+    # Invoice number (Folio) if present
+    folio_text = header.get(FOLIO)
+    invoice_number = folio_text.strip() if folio_text else None
+    if invoice_number == '':
+        invoice_number = None
+    # Invoice address from receptor data; some schemas use DirDest instead
+    addr = header.get(DIR_RECEP) or header.get(DIR_DEST)
+    invoice_address = addr.strip() if addr else None
+    return {
+        "supplier_rut": rut_emisor,
+        "supplier_name": nombre_emisor,
+        "doc_date": doc_date,
+        "invoice_number": invoice_number,
+        "invoice_address": invoice_address,
+        "items": items,
+    }
+
+
+def parse_dte_file(filepath: str) -> tuple[str, list[Dict[str, Any]]]:
+    """Stream a DTE envelope and return its root tag and the parsed DTEs.
+
+    The file is read incrementally with ``iterparse``; each DTE element is
+    detached from its parent as soon as it has been converted by
+    :func:`_parse_dte`, so memory stays bounded by a single DTE rather than
+    the whole envelope.
+    """
+    context = ElementTree.iterparse(filepath, events=("start", "end"))
+    _, root = next(context)
+    # Determine root tag for metadata
+    xml_root_tag = root.tag.split('}')[-1] if '}' in root.tag else root.tag
+    dtes = []
+    # Currently open elements; ElementTree has no parent pointers, so this is
+    # how a finished DTE finds the parent it has to be removed from. Clearing
+    # it alone would leave an empty element per DTE attached to SetDTE.
+    open_elements = [root]
+    for kind, elem in context:
+        if kind == "start":
+            open_elements.append(elem)
+            continue
+        open_elements.pop()
+        if elem.tag == DTE_TAG:
+            dtes.append(_parse_dte(elem))
+            if open_elements:  # a bare DTE file has no parent to detach from
+                open_elements[-1].remove(elem)
+    return xml_root_tag, dtes
+
+
+# Dashboards send the same few months over and over
+@functools.lru_cache(maxsize=256)
+def _month_bounds(month: str) -> tuple[date, date]:
+    """Return the first and last day of a YYYY-MM month.
+
+    Raises ValueError if ``month`` is not a valid YYYY-MM string.
+    """
+    first = datetime.strptime(month, "%Y-%m").date()
+    return first, first.replace(day=monthrange(first.year, first.month)[1])
+
+
+def _doc_date_filters(start_param: str | None, end_param: str | None) -> list:
+    """Return WHERE clauses restricting documents to a range of months.
+
+    Both bounds are YYYY-MM months and inclusive; a missing or malformed
+    bound is ignored. With both bounds a single BETWEEN is emitted. Range
+    comparisons already exclude NULL dates, so no separate IS NOT NULL check
+    is needed.
+    """
+    start_date = end_date = None
+    if start_param:
+        try:
+            start_date = _month_bounds(start_param)[0]
+        except ValueError:
+            pass
+    if end_param:
+        try:
+            end_date = _month_bounds(end_param)[1]
+        except ValueError:
+            pass
+    if start_date and end_date:
+        return [Document.doc_date.between(start_date, end_date)]
+    if start_date:
+        return [Document.doc_date >= start_date]
+    if end_date:
+        return [Document.doc_date <= end_date]
+    return []
+
+
+def _supplier_filter(supplier_param: str):
+    """Return a WHERE clause restricting documents to one supplier.
+
+    A numeric parameter is taken as the supplier id and compared directly
+    with Document.supplier_id; anything else is matched against supplier names
+    through a subquery. Neither form joins the suppliers table, so the filter
+    can be combined with other joins without duplicating it.
+    """
+    if supplier_param.isdigit():
+        return Document.supplier_id == int(supplier_param)
+    return Document.supplier_id.in_(select(Supplier.id).where(Supplier.name == supplier_param))
+
+
 @app.route("/api/documents", methods=["GET"])
+@cached_view
 def list_documents() -> tuple[Dict[str, Any], int]:
     """
     Return a list of uploaded documents along with their metadata.
@@ -217,6 +794,8 @@ def list_documents() -> tuple[Dict[str, Any], int]:
             after the first day of the month are included.
         end (str): End month in YYYY-MM format. Documents with a doc_date on or
             before the last day of the month are included.
+        limit (int): Maximum number of documents to return. Optional.
+        offset (int): Number of documents to skip, for paging. Optional.
 
     Returns:
         dict: {"documents": [doc.as_dict(), ...]}
@@ -225,43 +804,33 @@ def list_documents() -> tuple[Dict[str, Any], int]:
     invoice_param = request.args.get("invoice")
     start_param = request.args.get("start")
     end_param = request.args.get("end")
-    # Start with base query
-    query = Document.query
-    # Join supplier table if supplier filter provided
+    limit_param = request.args.get("limit")
+    offset_param = request.args.get("offset")
+    # Start with base query. as_dict touches the supplier, so join it in, and
+    # compute invoice totals in the same SELECT.
+    query = Document.query.options(
+        joinedload(Document.supplier),
+        undefer(Document.invoice_total),
+    )
+    # Supplier filter
     if supplier_param:
-        # Determine if numeric id or name
-        if supplier_param.isdigit():
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.id == int(supplier_param))
-        else:
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.name == supplier_param)
+        query = query.filter(_supplier_filter(supplier_param))
     # Date filters on doc_date
-    if start_param:
-        try:
-            start_dt = datetime.strptime(start_param, "%Y-%m").date()
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date >= start_dt)
-        except Exception:
-            pass
+    query = query.filter(*_doc_date_filters(start_param, end_param))
     # Invoice number filter (partial match)
     if invoice_param:
         # apply case-insensitive like filter
         query = query.filter(Document.invoice_number != None)
         like_pattern = f"%{invoice_param}%"
         query = query.filter(Document.invoice_number.ilike(like_pattern))
-    if end_param:
-        try:
-            from calendar import monthrange
-            end_dt = datetime.strptime(end_param, "%Y-%m")
-            year, month = end_dt.year, end_dt.month
-            last_day = monthrange(year, month)[1]
-            end_date = datetime(year, month, last_day).date()
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date <= end_date)
-        except Exception:
-            pass
-    docs = query.order_by(Document.upload_date.desc()).all()
+    # Newest first; id breaks ties so pages are stable
+    query = query.order_by(Document.upload_date.desc(), Document.id.desc())
+    # Optional pagination. Without limit/offset every matching document is returned
+    if limit_param and limit_param.isdigit():
+        query = query.limit(int(limit_param))
+    if offset_param and offset_param.isdigit():
+        query = query.offset(int(offset_param))
+    docs = query.all()
     return {"documents": [doc.as_dict() for doc in docs]}, 200
 
 
@@ -282,6 +851,9 @@ def upload_document() -> tuple[Dict[str, Any], int]:
     else:
         return {"error": "No file(s) part in the request."}, 400
     created_docs = []
+    # Line items are collected as plain dicts while parsing and inserted in a
+    # single bulk statement once their documents have been assigned ids.
+    pending_items: list[tuple[Document, Dict[str, Any]]] = []
     for upload in files:
         if upload.filename == '':
             # Skip empty file entries
@@ -297,108 +869,69 @@ def upload_document() -> tuple[Dict[str, Any], int]:
             base, extension = os.path.splitext(filename)
             filename = f"{base}_{int(datetime.utcnow().timestamp())}{extension}"
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        # Save file
-        upload.save(filepath)
-        size = os.path.getsize(filepath)
-        meta = extract_document_metadata(filepath, ext)
-        # If XML file: parse and extract supplier, document date and items
+        # Stream the upload to disk in 1 MiB chunks, counting bytes as they
+        # are written instead of stat-ing the file afterwards
+        size = 0
+        with open(filepath, "wb") as f:
+            while chunk := upload.stream.read(1 << 20):
+                f.write(chunk)
+                size += len(chunk)
+        # If XML file: parse and extract supplier, document date and items.
+        # parse_dte_file already reports the root tag, so the file is only
+        # read once unless parsing fails.
         if ext == "xml":
             try:
-                import xml.etree.ElementTree as ET
-                ns = {'sii': 'http://www.sii.cl/SiiDte'}
-                tree = ET.parse(filepath)
-                root_xml = tree.getroot()
-                # Determine root tag for metadata
-                xml_root_tag = root_xml.tag.split('}')[-1] if '}' in root_xml.tag else root_xml.tag
-                # Iterate over all DTE documents within XML
-                for idx, dte in enumerate(root_xml.findall('.//sii:DTE', ns)):
-                    # Extract supplier info
-                    emisor = dte.find('.//sii:Emisor', ns)
-                    rut_emisor = None
-                    nombre_emisor = None
-                    if emisor is not None:
-                        rut_emisor = emisor.findtext('sii:RUTEmisor', default='', namespaces=ns)
-                        # Some DTE documents use different tag names
-                        nombre_emisor = (
-                            emisor.findtext('sii:RznSoc', default='', namespaces=ns)
-                            or emisor.findtext('sii:RznSocEmisor', default='', namespaces=ns)
+                xml_root_tag, dtes = parse_dte_file(filepath)
+                # Each file gets its own SAVEPOINT: if storing it fails, only this
+                # file's rows are rolled back while the single commit at the end
+                # still covers every other file in the request.
+                file_docs: list[Document] = []
+                file_items: list[tuple[Document, Dict[str, Any]]] = []
+                with db.session.begin_nested():
+                    # Create the envelope's unseen suppliers with one INSERT ... ON
+                    # CONFLICT(rut) DO NOTHING, then map every RUT to its id with one
+                    # SELECT. Unlike check-then-insert, concurrent uploads that
+                    # introduce the same supplier cannot trip the unique rut
+                    # constraint. The first DTE naming a supplier provides its name.
+                    supplier_names: Dict[str, str] = {}
+                    for dte in dtes:
+                        rut_emisor = dte["supplier_rut"]
+                        if rut_emisor and rut_emisor not in supplier_names:
+                            supplier_names[rut_emisor] = dte["supplier_name"] or rut_emisor
+                    supplier_ids: Dict[str, int] = {}
+                    if supplier_names:
+                        db.session.execute(
+                            sqlite_insert(Supplier)
+                            .values([{"rut": rut, "name": name} for rut, name in supplier_names.items()])
+                            .on_conflict_do_nothing(index_elements=["rut"])
+                        )
+                        supplier_ids = dict(
+                            db.session.execute(
+                                select(Supplier.rut, Supplier.id).where(Supplier.rut.in_(supplier_names))
+                            ).all()
                         )
-                    # Find or create supplier
-                    supplier = None
-                    if rut_emisor:
-                        supplier = Supplier.query.filter_by(rut=rut_emisor).first()
-                        if supplier is None:
-                            supplier = Supplier(rut=rut_emisor, name=nombre_emisor or rut_emisor)
-                            db.session.add(supplier)
-                    # Document date and metadata extracted from IdDoc
-                    iddoc = dte.find('.//sii:IdDoc', ns)
-                    doc_date = None
-                    invoice_number = None
-                    if iddoc is not None:
-                        # Extract invoice date
-                        date_text = iddoc.findtext('sii:FchEmis', default='', namespaces=ns)
-                        if date_text:
-                            try:
-                                doc_date = datetime.strptime(date_text, '%Y-%m-%d').date()
-                            except Exception:
-                                doc_date = None
-                        # Extract invoice number (Folio) if present
-                        folio_text = iddoc.findtext('sii:Folio', default='', namespaces=ns)
-                        invoice_number = folio_text.strip() if folio_text else None
-                        if invoice_number == '':
-                            invoice_number = None
-                    # Extract invoice address from receptor data
-                    invoice_address = None
-                    receptor = dte.find('.//sii:Receptor', ns)
-                    if receptor is not None:
-                        # Try to get delivery address (DirRecep) or fallback to DirRecep if variants differ
-                        addr = receptor.findtext('sii:DirRecep', default='', namespaces=ns)
-                        if not addr:
-                            # Some schemas may use DirRecep or DirDest for address; check both
-                            addr = receptor.findtext('sii:DirDest', default='', namespaces=ns)
-                        invoice_address = addr.strip() if addr else None
-                    # Create document record per DTE with invoice number and address
-                    doc = Document(
-                        filename=filename,
-                        filetype=ext,
-                        pages=None,
-                        xml_root=xml_root_tag,
-                        size_bytes=size,
-                        supplier=supplier,
-                        doc_date=doc_date,
-                        invoice_number=invoice_number,
-                        invoice_address=invoice_address,
-                    )
-                    db.session.add(doc)
-                    created_docs.append(doc)
-                    # Extract items
-                    for det in dte.findall('.//sii:Detalle', ns):
-                        name_item = det.findtext('sii:NmbItem', default='', namespaces=ns)
-                        qty_text = det.findtext('sii:QtyItem', default='', namespaces=ns)
-                        price_text = det.findtext('sii:PrcItem', default='', namespaces=ns)
-                        total_text = det.findtext('sii:MontoItem', default='', namespaces=ns)
-                        try:
-                            quantity = float(qty_text) if qty_text else None
-                        except Exception:
-                            quantity = None
-                        try:
-                            price = float(price_text) if price_text else None
-                        except Exception:
-                            price = None
-                        try:
-                            total = float(total_text) if total_text else None
-                        except Exception:
-                            total = None
-                        item = Item(
-                            document=doc,
-                            name=name_item,
-                            quantity=quantity,
-                            price=price,
-                            total=total,
+                    for dte in dtes:
+                        # Create document record per DTE with invoice number and address
+                        doc = Document(
+                            filename=filename,
+                            filetype=ext,
+                            pages=None,
+                            xml_root=xml_root_tag,
+                            size_bytes=size,
+                            supplier_id=supplier_ids.get(dte["supplier_rut"]),
+                            doc_date=dte["doc_date"],
+                            invoice_number=dte["invoice_number"],
+                            invoice_address=dte["invoice_address"],
                         )
-                        db.session.add(item)
+                        db.session.add(doc)
+                        file_docs.append(doc)
+                        for row in dte["items"]:
+                            file_items.append((doc, row))
+                created_docs.extend(file_docs)
+                pending_items.extend(file_items)
             except Exception:
                 # Fallback: if parsing fails, create a single document record without items
+                meta = extract_document_metadata(filepath, ext)
                 doc = Document(
                     filename=filename,
                     filetype=ext,
@@ -410,6 +943,7 @@ def upload_document() -> tuple[Dict[str, Any], int]:
                 created_docs.append(doc)
         else:
             # Non-XML file: create a simple document record
+            meta = extract_document_metadata(filepath, ext)
             doc = Document(
                 filename=filename,
                 filetype=ext,
@@ -419,11 +953,33 @@ def upload_document() -> tuple[Dict[str, Any], int]:
             )
             db.session.add(doc)
             created_docs.append(doc)
+    # Flush documents to obtain their ids, then insert all items at once
+    db.session.flush()
+    # Read the ids now: after the commit every attribute access would reload
+    # its document with a SELECT of its own
+    created_ids = [d.id for d in created_docs]
+    item_rows = []
+    for doc, row in pending_items:
+        row["document_id"] = doc.id
+        item_rows.append(row)
+    if item_rows:
+        # One executemany INSERT for every line item of the request
+        db.session.execute(insert(Item), item_rows)
+        _add_product_month_stats(list({row["document_id"] for row in item_rows}))
     # Commit after processing all files
     db.session.commit()
+    invalidate_response_cache()
     # Return list or single object for backwards compatibility
     if not created_docs:
         return {"error": "No valid files were uploaded."}, 400
+    # The commit expired the new documents; reload them with their supplier and
+    # total in one query instead of refreshing each one
+    created_docs = (
+        Document.query.options(joinedload(Document.supplier), undefer(Document.invoice_total))
+        .filter(Document.id.in_(created_ids))
+        .order_by(Document.id)
+        .all()
+    )
     if len(created_docs) == 1:
         return created_docs[0].as_dict(), 201
     return {"documents": [d.as_dict() for d in created_docs]}, 201
@@ -435,79 +991,133 @@ def get_document(doc_id: int) -> tuple[Dict[str, Any], int]:
 
     This endpoint does not return the file content itself but its metadata.
     """
-    doc = Document.query.get(doc_id)
+    doc = db.session.get(
+        Document, doc_id, options=[joinedload(Document.supplier), undefer(Document.invoice_total)]
+    )
     if doc is None:
         return {"error": f"Documento con id {doc_id} no encontrado."}, 404
     return doc.as_dict(), 200
 
 
-@app.route("/api/documents/<int:doc_id>/download", methods=["GET"])
-def download_document(doc_id: int):
-    """
-    Generate a simple PDF summary of the document containing supplier details,
-    items with quantities, unit prices and subtotals, and invoice totals.
+# Column widths (mm) of the item table in the PDF summary
+_PDF_TABLE_WIDTHS = (80, 30, 30, 40)
+# fpdf2 has no Arial core font: asking for "Arial" substitutes Helvetica and
+# emits a warning on every set_font call, so request Helvetica directly
+_PDF_FONT = "Helvetica"
 
-    If the document does not exist, returns a 404 JSON error.
+
+def _pdf_table_row(pdf: FPDF, values: tuple[str, ...], height: float) -> None:
+    """Draw one bordered row of the PDF item table.
+
+    The row is drawn with rect/text primitives instead of one ``cell`` per
+    value: ``cell`` runs fpdf2's full styled-text layout on every call, which
+    dominated rendering time for invoices with many lines. The first column is
+    left-aligned and the rest right-aligned, positioned exactly as ``cell``
+    would place them.
     """
-    doc = Document.query.get(doc_id)
-    if doc is None:
-        return {"error": f"Documento con id {doc_id} no encontrado."}, 404
-    # Generate PDF using fpdf2
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
+    if pdf.will_page_break(height):
+        pdf.add_page()
+    x = pdf.l_margin
+    y = pdf.get_y()
+    baseline = y + 0.5 * height + 0.3 * pdf.font_size
+    for index, (width, text) in enumerate(zip(_PDF_TABLE_WIDTHS, values)):
+        pdf.rect(x, y, width, height)
+        if index == 0:
+            text_x = x + pdf.c_margin
+        else:
+            text_x = x + width - pdf.c_margin - pdf.get_string_width(text)
+        pdf.text(text_x, baseline, text)
+        x += width
+    pdf.set_y(y + height)
+
+
+def _pdf_label_rows(
+    pdf: FPDF,
+    rows: tuple[tuple[str, str], ...],
+    label_width: float,
+    value_width: float = 0,
+    value_align: str = "L",
+) -> None:
+    """Draw rows of bold labels followed by their regular-weight values.
+
+    All labels are drawn first and then all values next to them, so the font
+    changes once per column instead of twice per row. The block is moved to a
+    new page up front when it would not fit, keeping both columns together.
+    """
+    height = 8
+    if pdf.will_page_break(height * len(rows)):
+        pdf.add_page()
+    top = pdf.get_y()
+    pdf.set_font(_PDF_FONT, style="B", size=12)
+    for label, _ in rows:
+        pdf.cell(label_width, height, label, ln=True)
+    pdf.set_y(top)
+    pdf.set_font(_PDF_FONT, size=12)
+    for _, value in rows:
+        pdf.set_x(pdf.l_margin + label_width)
+        pdf.cell(value_width, height, value, align=value_align, ln=True)
+
+
+def _render_invoice(pdf: FPDF, doc: Document) -> None:
+    """Render the summary of one document on a new page of ``pdf``.
+
+    The summary contains supplier details, items with quantities, unit prices
+    and subtotals, and invoice totals.
+    """
+    supplier = doc.supplier
+    supplier_name = supplier.name if supplier else "-"
+    supplier_rut = supplier.rut if supplier else "-"
+    doc_date = doc.doc_date.strftime("%d/%m/%Y") if doc.doc_date else "-"
     pdf.add_page()
-    pdf.set_font("Arial", style="B", size=16)
+    pdf.set_font(_PDF_FONT, style="B", size=16)
     pdf.cell(0, 10, "Resumen de Factura", ln=True)
     pdf.ln(5)
     # Supplier info
-    pdf.set_font("Arial", style="B", size=12)
-    pdf.cell(40, 8, "Proveedor:")
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, doc.supplier.name if doc.supplier else "-", ln=True)
-    pdf.set_font("Arial", style="B", size=12)
-    pdf.cell(40, 8, "RUT:")
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, doc.supplier.rut if doc.supplier else "-", ln=True)
-    pdf.set_font("Arial", style="B", size=12)
-    pdf.cell(40, 8, "Fecha factura:")
-    pdf.set_font("Arial", size=12)
-    if doc.doc_date:
-        pdf.cell(0, 8, doc.doc_date.strftime("%d/%m/%Y"), ln=True)
-    else:
-        pdf.cell(0, 8, "-", ln=True)
+    _pdf_label_rows(pdf, (
+        ("Proveedor:", supplier_name),
+        ("RUT:", supplier_rut),
+        ("Fecha factura:", doc_date),
+    ), label_width=40)
     pdf.ln(5)
-    # Table headers
-    pdf.set_font("Arial", style="B", size=11)
-    pdf.cell(80, 8, "Producto", border=1)
-    pdf.cell(30, 8, "Cantidad", border=1, align="R")
-    pdf.cell(30, 8, "Precio", border=1, align="R")
-    pdf.cell(40, 8, "Subtotal", border=1, align="R")
-    pdf.ln()
-    pdf.set_font("Arial", size=10)
     total_neto = 0.0
-    for item in doc.items:
-        qty = item.quantity or 0
-        price = item.price or 0
-        subtotal = item.total if item.total is not None else qty * price
-        total_neto += subtotal or 0
-        pdf.cell(80, 7, str(item.name), border=1)
-        pdf.cell(30, 7, f"{qty:.2f}" if qty else "-", border=1, align="R")
-        pdf.cell(30, 7, f"{price:,.0f}" if price else "-", border=1, align="R")
-        pdf.cell(40, 7, f"{subtotal:,.0f}" if subtotal else "-", border=1, align="R")
-        pdf.ln()
+    items = doc.items
+    # The item table is only drawn when there are rows to put in it
+    if items:
+        pdf.set_font(_PDF_FONT, style="B", size=11)
+        _pdf_table_row(pdf, ("Producto", "Cantidad", "Precio", "Subtotal"), 8)
+        pdf.set_font(_PDF_FONT, size=10)
+        format_qty = "{:.2f}".format
+        format_amount = "{:,.0f}".format
+        for item in items:
+            qty = item.quantity or 0
+            price = item.price or 0
+            subtotal = item.total if item.total is not None else qty * price
+            total_neto += subtotal or 0
+            _pdf_table_row(pdf, (
+                str(item.name),
+                format_qty(qty) if qty else "-",
+                format_amount(price) if price else "-",
+                format_amount(subtotal) if subtotal else "-",
+            ), 7)
     # Totals
     pdf.ln(3)
-    pdf.set_font("Arial", style="B", size=12)
-    pdf.cell(80, 8, "Total neto:")
-    pdf.set_font("Arial", size=12)
-    pdf.cell(40, 8, f"{total_neto:,.0f}", align="R")
-    pdf.ln()
-    invoice_total = doc.as_dict().get("invoice_total", 0)
-    pdf.set_font("Arial", style="B", size=12)
-    pdf.cell(80, 8, "Total factura:")
-    pdf.set_font("Arial", size=12)
-    pdf.cell(40, 8, f"{invoice_total:,.0f}", align="R")
-    # Output PDF as bytes
+    # Same sum as Document.invoice_total, already accumulated above
+    invoice_total = total_neto
+    _pdf_label_rows(pdf, (
+        ("Total neto:", f"{total_neto:,.0f}"),
+        ("Total factura:", f"{invoice_total:,.0f}"),
+    ), label_width=80, value_width=40, value_align="R")
+
+
+def _new_summary_pdf() -> FPDF:
+    """Create an empty FPDF document configured for invoice summaries."""
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    return pdf
+
+
+def _pdf_response(pdf: FPDF, filename: str) -> Response:
+    """Return the rendered PDF as a file download."""
     # Retrieve PDF as a string or bytes; ensure we convert to bytes before sending
     pdf_data = pdf.output(dest="S")
     # fpdf2 may return a bytearray or string depending on version
@@ -516,12 +1126,59 @@ def download_document(doc_id: int):
     else:
         # Encode string to Latin‑1 bytes
         pdf_bytes = pdf_data.encode("latin1")
-    filename = f"factura_resumen_{doc.id}.pdf"
     return Response(pdf_bytes, headers={
         "Content-Type": "application/pdf",
         "Content-Disposition": f"attachment; filename={filename}"
     })
 
+
+@app.route("/api/documents/<int:doc_id>/download", methods=["GET"])
+def download_document(doc_id: int):
+    """
+    Generate a simple PDF summary of the document containing supplier details,
+    items with quantities, unit prices and subtotals, and invoice totals.
+
+    If the document does not exist, returns a 404 JSON error.
+    """
+    doc = db.session.get(Document, doc_id, options=[joinedload(Document.supplier)])
+    if doc is None:
+        return {"error": f"Documento con id {doc_id} no encontrado."}, 404
+    pdf = _new_summary_pdf()
+    _render_invoice(pdf, doc)
+    return _pdf_response(pdf, f"factura_resumen_{doc.id}.pdf")
+
+
+@app.route("/api/documents/download_batch", methods=["POST"])
+def download_documents_batch():
+    """Generate a single PDF with the summary of several documents.
+
+    Expects a JSON body with an "ids" list of document IDs. Each document is
+    rendered on its own page(s), in the order the IDs were given; unknown IDs
+    are skipped. Returns 400 if no IDs are given and 404 if none exist.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = [int(doc_id) for doc_id in data.get("ids") or []]
+    except (TypeError, ValueError):
+        return {"error": "Los ids de documento deben ser enteros."}, 400
+    if not ids:
+        return {"error": "Debe indicar al menos un id de documento."}, 400
+    # Suppliers come through a JOIN and items through one extra IN query for
+    # the whole batch, instead of lazy loads per document
+    docs = db.session.execute(
+        select(Document)
+        .where(Document.id.in_(ids))
+        .options(joinedload(Document.supplier), selectinload(Document.items))
+    ).scalars().all()
+    if not docs:
+        return {"error": "Ninguno de los documentos indicados existe."}, 404
+    position = {doc_id: index for index, doc_id in enumerate(ids)}
+    docs.sort(key=lambda doc: position[doc.id])
+    pdf = _new_summary_pdf()
+    for doc in docs:
+        _render_invoice(pdf, doc)
+    return _pdf_response(pdf, "facturas_resumen.pdf")
+
 # ---------------------------------------------------------------------------
 # Additional API endpoints for bulk deletion and Excel export
 
@@ -532,6 +1189,51 @@ def delete_all_documents() -> Any:
     return {"message": "Todos los documentos han sido eliminados"}, 200
 
 
+def _xlsx_response(sheet_name: str, headers: list[str], rows, filename: str) -> Response:
+    """Write rows to a single-sheet Excel workbook and return it as a download.
+
+    Uses openpyxl's write-only mode, which streams rows to the file instead of
+    keeping a cell tree for the whole sheet in memory.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    header_cells = []
+    for title in headers:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append(row)
+    output = io.BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        as_attachment=True,
+        download_name=filename,
+    )
+
+
+# group_concat(DISTINCT ...) only accepts the default "," separator in SQLite,
+# so commas inside values are swapped for a control character before
+# concatenating and restored when splitting.
+_CONCAT_COMMA = "\x1f"
+
+
+def _distinct_concat(column):
+    """Return a ``group_concat(DISTINCT column)`` expression safe for values with commas."""
+    return db.func.group_concat(db.distinct(db.func.replace(column, ",", _CONCAT_COMMA)))
+
+
+def _split_concat(value: str | None) -> list[str]:
+    """Split a :func:`_distinct_concat` result into sorted, non-empty values."""
+    if not value:
+        return []
+    return sorted(v.replace(_CONCAT_COMMA, ",") for v in value.split(",") if v)
+
+
 @app.route("/api/analytics/products/export", methods=["GET"])
 def export_products_excel() -> Any:
     """
@@ -550,114 +1252,77 @@ def export_products_excel() -> Any:
     Returns:
         A streaming response with the Excel file for download.
     """
-    # Query aggregated data per product, along with month and supplier details
-    rows = (
-        db.session.query(
+    # Aggregate everything per product in a single GROUP BY query. Set-like
+    # columns (months, suppliers, invoices...) come back as comma-separated
+    # distinct values. Rows carry no entities, so they are read through Core
+    # select() rather than the ORM Query API.
+    rows = db.session.execute(
+        select(
             Item.name.label("producto"),
-            db.func.strftime('%m%Y', Document.doc_date).label("mes"),
-            Supplier.name.label("proveedor"),
-            Supplier.rut.label("rut_proveedor"),
-            Item.quantity.label("cantidad"),
-            Item.price.label("precio"),
-            Document.invoice_number.label("invoice_number"),
-            Document.invoice_address.label("invoice_address"),
+            _distinct_concat(db.func.strftime('%m%Y', Document.doc_date)).label("meses"),
+            _distinct_concat(Supplier.name).label("proveedores"),
+            _distinct_concat(Supplier.rut).label("rut_proveedores"),
+            _distinct_concat(Document.invoice_number).label("facturas"),
+            _distinct_concat(Document.invoice_address).label("direcciones"),
+            db.func.coalesce(db.func.sum(Item.quantity), 0).label("total_qty"),
+            db.func.coalesce(db.func.sum(Item.quantity * Item.price), 0).label("total_value"),
+            db.func.coalesce(db.func.min(Item.price), 0).label("min_price"),
+            db.func.coalesce(db.func.max(Item.price), 0).label("max_price"),
+            db.func.coalesce(db.func.avg(Item.price), 0).label("avg_price"),
         )
         .join(Document, Document.id == Item.document_id)
         .join(Supplier, Supplier.id == Document.supplier_id)
-        .filter(Document.doc_date != None)
-        .all()
+        .where(Document.doc_date != None)
+        .group_by(Item.name)
+        .order_by(Item.name)
     )
-    # Organize data by product
-    summary: Dict[str, Dict[str, Any]] = {}
-    for r in rows:
-        prod = r.producto
-        if prod not in summary:
-            summary[prod] = {
-                "meses": set(),
-                "proveedores": set(),
-                "rut_proveedores": set(),
-                "facturas": set(),
-                "direcciones": set(),
-                "cantidades": [],
-                "precios": [],
-                "valores": [],  # total value per line (qty * price)
-            }
-        summary[prod]["meses"].add(r.mes)
-        summary[prod]["proveedores"].add(r.proveedor)
-        summary[prod]["rut_proveedores"].add(r.rut_proveedor)
-        # Collect invoice numbers and addresses
-        if r.invoice_number:
-            summary[prod]["facturas"].add(str(r.invoice_number))
-        if r.invoice_address:
-            summary[prod]["direcciones"].add(str(r.invoice_address))
-        if r.cantidad is not None:
-            summary[prod]["cantidades"].append(float(r.cantidad))
-        if r.precio is not None:
-            summary[prod]["precios"].append(float(r.precio))
-            # Compute value if quantity available
-            if r.cantidad is not None:
-                try:
-                    summary[prod]["valores"].append(float(r.cantidad) * float(r.precio))
-                except Exception:
-                    pass
-    # Build rows for DataFrame
-    records = []
-    for prod, info in summary.items():
-        meses_sorted = sorted(info["meses"])
-        meses_str = "-".join(meses_sorted)
-        proveedores_str = "; ".join(sorted(info["proveedores"]))
-        rut_str = "; ".join(sorted(info["rut_proveedores"]))
-        facturas_str = "; ".join(sorted(info["facturas"])) if info["facturas"] else ""
-        direcciones_str = "; ".join(sorted(info["direcciones"])) if info["direcciones"] else ""
-        cantidades = info["cantidades"] or [0]
-        precios = info["precios"] or [0]
-        valores = info["valores"] or [0]
-        total_qty = sum(cantidades)
-        min_price = min(precios)
-        max_price = max(precios)
-        avg_price = sum(precios) / len(precios) if precios else 0
-        total_value = sum(valores)
-        records.append({
-            "Producto": prod,
-            "Meses": meses_str,
-            "Proveedores": proveedores_str,
-            "RUT proveedores": rut_str,
-            "Facturas": facturas_str,
-            "Direcciones": direcciones_str,
-            "Cantidad total": total_qty,
-            "Valor total": total_value,
-            "Precio mínimo": min_price,
-            "Precio máximo": max_price,
-            "Precio promedio": avg_price,
-        })
-    # Create DataFrame
-    df = pd.DataFrame(records)
-    # Sort by product name
-    df.sort_values(by="Producto", inplace=True)
-    # Write to Excel in memory
-    output = io.BytesIO()
-    with pd.ExcelWriter(output) as writer:
-        df.to_excel(writer, index=False, sheet_name="Productos")
-    output.seek(0)
-    # Return as response
-    return (
-        output.getvalue(),
-        200,
-        {
-            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "Content-Disposition": "attachment; filename=productos.xlsx",
-        },
+    headers = [
+        "Producto", "Meses", "Proveedores", "RUT proveedores", "Facturas", "Direcciones",
+        "Cantidad total", "Valor total", "Precio mínimo", "Precio máximo", "Precio promedio",
+    ]
+    # Rows are already sorted by product name
+    records = (
+        [
+            r.producto,
+            "-".join(_split_concat(r.meses)),
+            "; ".join(_split_concat(r.proveedores)),
+            "; ".join(_split_concat(r.rut_proveedores)),
+            "; ".join(_split_concat(r.facturas)),
+            "; ".join(_split_concat(r.direcciones)),
+            r.total_qty,
+            r.total_value,
+            r.min_price,
+            r.max_price,
+            r.avg_price,
+        ]
+        for r in rows
     )
+    return _xlsx_response("Productos", headers, records, "productos.xlsx")
+
+
+# Number of products, by quantity bought this year, that get a projection
+AI_PROJECTIONS_LIMIT = 50
+
+
+def _current_month() -> str:
+    """Return the current month as YYYY-MM."""
+    return datetime.now().strftime("%Y-%m")
 
 
 @app.route("/api/analytics/ai", methods=["GET"])
+# Projections depend on today's month as well as on the data
+@cached_view(vary=_current_month)
 def ai_insights() -> Any:
     """
     Provide simple AI-driven insights and projections based on purchase data.
 
     Suggestions include identifying the most purchased product of the current year and
-    projecting total quantities for each product by the end of the year based on
-    average monthly consumption.
+    projecting total quantities by the end of the year based on average monthly
+    consumption for the most purchased products.
+
+    Optional query parameters:
+        limit (int): Maximum number of products with projections. Defaults to
+            AI_PROJECTIONS_LIMIT.
 
     Returns:
         A JSON object with "suggestions": list of strings, and "projections": dict.
@@ -665,35 +1330,50 @@ def ai_insights() -> Any:
     now = datetime.now()
     current_year = now.year
     current_month = now.month
-    # Aggregate total quantities per product for the current year
-    product_totals = (
-        db.session.query(
-            Item.name,
-            db.func.sum(Item.quantity).label("total_qty")
+    limit_param = request.args.get("limit")
+    limit = AI_PROJECTIONS_LIMIT
+    if limit_param and limit_param.isdigit() and int(limit_param) > 0:
+        limit = int(limit_param)
+    # Yearly totals per product in a CTE; averages and projections are derived
+    # in the same statement so Python only reshapes rows. Ties on quantity keep
+    # the alphabetically first product as the top one. The year is matched as a
+    # date range so the doc_date index can be used.
+    totals = (
+        select(
+            Item.name.label("name"),
+            db.func.coalesce(db.func.sum(Item.quantity), 0).label("qty"),
         )
         .join(Document, Document.id == Item.document_id)
-        .filter(Document.doc_date != None)
-        .filter(db.func.strftime('%Y', Document.doc_date) == str(current_year))
+        .where(Document.doc_date >= datetime(current_year, 1, 1).date())
+        .where(Document.doc_date < datetime(current_year + 1, 1, 1).date())
         .group_by(Item.name)
-        .all()
+        .cte("totals")
     )
-    projections = {}
+    avg_monthly = totals.c.qty * 1.0 / current_month
+    projected_remaining = avg_monthly * (12 - current_month)
+    rows = db.session.execute(
+        select(
+            totals.c.name,
+            totals.c.qty,
+            avg_monthly,
+            projected_remaining,
+            totals.c.qty + projected_remaining,
+        ).order_by(totals.c.qty.desc(), totals.c.name).limit(limit)
+    ).all()
+    projections = {
+        name: {
+            "cantidad_actual": float(qty),
+            "promedio_mensual": float(avg),
+            "proyeccion_restante": float(remaining),
+            "proyeccion_total": float(total),
+        }
+        for name, qty, avg, remaining, total in rows
+    }
     top_product = None
     top_qty = 0
-    for name, total_qty in product_totals:
-        qty = float(total_qty or 0)
-        if qty > top_qty:
-            top_qty = qty
-            top_product = name
-        avg_monthly = qty / current_month if current_month else qty
-        projected_remaining = avg_monthly * (12 - current_month)
-        projected_total = qty + projected_remaining
-        projections[name] = {
-            "cantidad_actual": qty,
-            "promedio_mensual": avg_monthly,
-            "proyeccion_restante": projected_remaining,
-            "proyeccion_total": projected_total,
-        }
+    if rows and rows[0].qty > 0:
+        top_product = rows[0].name
+        top_qty = float(rows[0].qty)
     suggestions = []
     if top_product:
         suggestions.append(
@@ -707,36 +1387,58 @@ def ai_insights() -> Any:
     return {"suggestions": suggestions, "projections": projections}, 200
 
 
+def _has_documents() -> bool:
+    """Return whether any document exists, using a single-row primary key probe.
+
+    Lets aggregate endpoints answer an empty database without running their
+    GROUP BY queries.
+    """
+    return db.session.execute(select(Document.id).limit(1)).first() is not None
+
+
 @app.route("/api/dashboard", methods=["GET"])
+@cached_view
 def dashboard_data() -> tuple[Dict[str, Any], int]:
     """Return aggregated statistics for dashboard visualizations.
 
-    Provides counts of documents per type, total size per type, and average pages
-    for PDFs. XML documents will have pages as None. Also returns a list of
-    file sizes for histogram representation.
+    Provides, per file type, the document count and total size as a flat
+    "by_type" list of {"type", "count", "size"} entries, and the average pages
+    for PDFs. XML documents will have pages as None. Also returns
+    "size_histogram", a list of {"label", "count"} entries with the number of
+    documents in each file size bucket of DASHBOARD_SIZE_BUCKETS.
     """
-    docs = Document.query.all()
+    # Everything is read from the DocumentStats rollup, which holds one row
+    # per (file type, month, supplier, size bucket) instead of one per document
+    rows = db.session.execute(
+        select(
+            DocumentStats.filetype,
+            db.func.sum(DocumentStats.count),
+            db.func.sum(DocumentStats.total_size),
+            db.func.sum(DocumentStats.pdf_pages_sum),
+            db.func.sum(DocumentStats.pdf_pages_count),
+        )
+        .group_by(DocumentStats.filetype)
+        .order_by(DocumentStats.filetype)
+    ).all()
+    bucket_counts = dict(
+        db.session.execute(
+            select(DocumentStats.size_bucket, db.func.sum(DocumentStats.count))
+            .group_by(DocumentStats.size_bucket)
+        ).all()
+    )
     stats = {
-        "count_per_type": {},
-        "total_size_per_type": {},
+        "by_type": [
+            {"type": filetype, "count": count, "size": total_size}
+            for filetype, count, total_size, _, _ in rows
+        ],
         "avg_pages": None,
-        "file_sizes": [],
+        "size_histogram": [
+            {"label": label, "count": bucket_counts.get(i, 0)}
+            for i, (label, _) in enumerate(DASHBOARD_SIZE_BUCKETS)
+        ],
     }
-    total_pages = 0
-    pdf_count = 0
-    for doc in docs:
-        # Count documents per type
-        stats["count_per_type"].setdefault(doc.filetype, 0)
-        stats["count_per_type"][doc.filetype] += 1
-        # Aggregate sizes
-        stats["total_size_per_type"].setdefault(doc.filetype, 0)
-        stats["total_size_per_type"][doc.filetype] += doc.size_bytes
-        # Collect size list
-        stats["file_sizes"].append(doc.size_bytes)
-        # Aggregate pages for PDFs
-        if doc.filetype == "pdf" and doc.pages is not None:
-            pdf_count += 1
-            total_pages += doc.pages
+    total_pages = sum(row[3] for row in rows)
+    pdf_count = sum(row[4] for row in rows)
     if pdf_count:
         stats["avg_pages"] = total_pages / pdf_count
     return stats, 200
@@ -763,77 +1465,53 @@ def export_documents_csv():
         start_param = request.args.get("start")
         end_param = request.args.get("end")
         if supplier_param:
-            # Determine numeric id or name
-            if supplier_param.isdigit():
-                query = query.join(Supplier, Supplier.id == Document.supplier_id)
-                query = query.filter(Supplier.id == int(supplier_param))
-            else:
-                query = query.join(Supplier, Supplier.id == Document.supplier_id)
-                query = query.filter(Supplier.name == supplier_param)
-        if start_param:
-            try:
-                start_dt = datetime.strptime(start_param, "%Y-%m").date()
-                query = query.filter(Document.doc_date != None)
-                query = query.filter(Document.doc_date >= start_dt)
-            except Exception:
-                pass
-        if end_param:
-            try:
-                from calendar import monthrange
-                end_dt = datetime.strptime(end_param, "%Y-%m")
-                year, month = end_dt.year, end_dt.month
-                last_day = monthrange(year, month)[1]
-                end_date = datetime(year, month, last_day).date()
-                query = query.filter(Document.doc_date != None)
-                query = query.filter(Document.doc_date <= end_date)
-            except Exception:
-                pass
-    docs = query.all()
-    # Build CSV content
-    import csv
-    from io import StringIO
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "id",
-        "filename",
-        "filetype",
-        "pages",
-        "xml_root",
-        "size_bytes",
-        "upload_date",
-        "supplier_name",
-        "supplier_rut",
-        "doc_date",
-        "invoice_total",
-    ])
-    for doc in docs:
-        # Compute invoice total similar to Document.as_dict
-        invoice_total = 0.0
-        for itm in doc.items:
-            if itm.total is not None:
-                invoice_total += float(itm.total)
-            elif itm.quantity is not None and itm.price is not None:
-                invoice_total += float(itm.quantity) * float(itm.price)
+            query = query.filter(_supplier_filter(supplier_param))
+        query = query.filter(*_doc_date_filters(start_param, end_param))
+    # Load suppliers through a JOIN and the invoice total as a correlated
+    # subquery, so neither needs a lazy load per exported document
+    query = query.options(joinedload(Document.supplier), undefer(Document.invoice_total))
+
+    def generate():
+        # Rows are fetched in batches and written out in ~64 KiB chunks, so the
+        # export never holds the whole CSV (or result set) in memory
+        output = io.StringIO()
+        writer = csv.writer(output)
         writer.writerow([
-            doc.id,
-            doc.filename,
-            doc.filetype,
-            doc.pages or "",
-            doc.xml_root or "",
-            doc.size_bytes,
-            doc.upload_date.isoformat(),
-            doc.supplier.name if doc.supplier else "",
-            doc.supplier.rut if doc.supplier else "",
-            doc.doc_date.isoformat() if doc.doc_date else "",
-            invoice_total,
+            "id",
+            "filename",
+            "filetype",
+            "pages",
+            "xml_root",
+            "size_bytes",
+            "upload_date",
+            "supplier_name",
+            "supplier_rut",
+            "doc_date",
+            "invoice_total",
         ])
-    csv_content = output.getvalue()
-    output.close()
-    return (
-        csv_content,
-        200,
-        {
+        for doc in query.yield_per(500):
+            writer.writerow([
+                doc.id,
+                doc.filename,
+                doc.filetype,
+                doc.pages or "",
+                doc.xml_root or "",
+                doc.size_bytes,
+                doc.upload_date.isoformat(),
+                doc.supplier.name if doc.supplier else "",
+                doc.supplier.rut if doc.supplier else "",
+                doc.doc_date.isoformat() if doc.doc_date else "",
+                float(doc.invoice_total or 0),
+            ])
+            if output.tell() >= 1 << 16:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        headers={
             "Content-Type": "text/csv; charset=utf-8",
             "Content-Disposition": "attachment; filename=documents.csv",
         },
@@ -841,27 +1519,57 @@ def export_documents_csv():
 
 
 @app.route("/api/products", methods=["GET"])
+@cached_view
 def list_products():
     """Return a list of unique product names extracted from items."""
-    products = db.session.query(Item.name).distinct().all()
-    product_list = [p[0] for p in products]
+    # Names come back as plain scalars, already sorted by the name index
+    product_list = db.session.execute(
+        select(Item.name).distinct().order_by(Item.name)
+    ).scalars().all()
     return {"products": product_list}, 200
 
 # ---------------------------------------------------------------------------
 # Additional API routes for suppliers, filtered product analytics, categories
 
 @app.route("/api/suppliers", methods=["GET"])
+@cached_view
 def list_suppliers() -> tuple[Dict[str, Any], int]:
     """Return a list of all suppliers with their id, rut and name."""
-    suppliers = Supplier.query.order_by(Supplier.name).all()
-    return {
-        "suppliers": [
-            {"id": s.id, "rut": s.rut, "name": s.name} for s in suppliers
-        ]
-    }, 200
+    # Plain column rows, without building a Supplier object per row
+    suppliers = db.session.execute(
+        select(Supplier.id, Supplier.rut, Supplier.name).order_by(Supplier.name)
+    ).mappings()
+    return {"suppliers": [dict(s) for s in suppliers]}, 200
+
+
+def _product_totals(
+    start_param: str | None, end_param: str | None, supplier_param: str | None
+) -> list[tuple[str, float | None, float | None]]:
+    """Return (name, total_qty, total_value) per product for the given filters.
+
+    Shared by the products chart and the categories summary, which aggregate
+    the same rows and differ only in how they group them afterwards.
+
+    Args:
+        start_param: Start month in format YYYY-MM. Inclusive.
+        end_param: End month in format YYYY-MM. Inclusive.
+        supplier_param: Supplier id or name. If numeric, treated as id.
+    """
+    stmt = select(
+        Item.name.label("producto"),
+        db.func.sum(Item.quantity).label("total_qty"),
+        db.func.sum(Item.quantity * Item.price).label("total_value"),
+    ).join(Document, Document.id == Item.document_id)
+    # Date filters
+    stmt = stmt.where(*_doc_date_filters(start_param, end_param))
+    # Supplier filter
+    if supplier_param:
+        stmt = stmt.where(_supplier_filter(supplier_param))
+    return db.session.execute(stmt.group_by(Item.name)).all()
 
 
 @app.route("/api/analytics/products/chart", methods=["GET"])
+@cached_view
 def products_chart() -> tuple[Dict[str, Any], int]:
     """
     Return aggregated product quantities and values based on optional filters.
@@ -874,45 +1582,9 @@ def products_chart() -> tuple[Dict[str, Any], int]:
     Response:
         dict: { "products": {product_name: {"total_qty": float, "total_value": float}} }
     """
-    start_param = request.args.get("start")
-    end_param = request.args.get("end")
-    supplier_param = request.args.get("supplier")
-    query = db.session.query(
-        Item.name.label("producto"),
-        db.func.sum(Item.quantity).label("total_qty"),
-        db.func.sum(Item.quantity * Item.price).label("total_value"),
-    ).join(Document, Document.id == Item.document_id)
-    # Apply date filters if provided
-    if start_param:
-        try:
-            start_date = datetime.strptime(start_param, "%Y-%m")
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date >= start_date.date())
-        except Exception:
-            pass
-    if end_param:
-        try:
-            end_date = datetime.strptime(end_param, "%Y-%m")
-            # To include the entire month, add one month and subtract a day
-            # but since we just compare with <=, we can set to last day of month by using next month start minus one day
-            from calendar import monthrange
-            year, month = end_date.year, end_date.month
-            last_day = monthrange(year, month)[1]
-            end_full_date = datetime(year, month, last_day).date()
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date <= end_full_date)
-        except Exception:
-            pass
-    # Apply supplier filter if provided
-    if supplier_param:
-        # Determine if numeric id or name
-        if supplier_param.isdigit():
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.id == int(supplier_param))
-        else:
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.name == supplier_param)
-    result_rows = query.group_by(Item.name).all()
+    result_rows = _product_totals(
+        request.args.get("start"), request.args.get("end"), request.args.get("supplier")
+    )
     products_summary: Dict[str, Dict[str, float]] = {}
     for prod, total_qty, total_value in result_rows:
         products_summary[prod] = {
@@ -922,7 +1594,85 @@ def products_chart() -> tuple[Dict[str, Any], int]:
     return {"products": products_summary}, 200
 
 
+# Product categories inferred from keywords in the item name, as
+# (category, [keywords]) tuples. Order matters: first match wins. Products
+# matching none of them fall into "Otros".
+PRODUCT_CATEGORIES = [
+    ("Carnes", ["carne", "pollo", "vacuno", "res", "cerdo", "cordero", "jamón", "tocino", "salchicha"]),
+    ("Pescados y Mariscos", ["pescado", "marisco", "atún", "salmón", "camaron", "merluza", "ostión", "chorito"]),
+    ("Lácteos", ["queso", "leche", "yogur", "mantequilla", "crema", "manjar", "helado"]),
+    ("Frutas", ["manzana", "plátano", "banana", "pera", "uva", "fresa", "frutilla", "mora", "fruta", "kiwi", "naranja", "melón", "durazno", "sandía", "piña"]),
+    ("Verduras", ["tomate", "cebolla", "lechuga", "zanahoria", "papa", "verdura", "champiñón", "brocoli", "pimiento", "col", "espinaca", "berenjena", "zapallo", "pepino", "ajo"]),
+    ("Panadería y Pastelería", ["pan", "bolleria", "bollería", "croissant", "baguette", "empanada", "empanada de horno", "torta", "pastel", "gallet", "postre", "queque"]),
+    ("Snacks y Dulces", ["snack", "galleta", "chocolate", "dulce", "caramelo", "barra", "papas fritas", "chips", "maní", "nueces", "almendra"]),
+    ("Cereales y Granos", ["arroz", "frijol", "lenteja", "poroto", "garbanzo", "cereal", "avena"]),
+    ("Pastas y Harinas", ["pasta", "fideo", "harina", "spaghetti", "macarrón", "macarrones"]),
+    ("Aceites y Condimentos", ["aceite", "sal", "azúcar", "especia", "condimento", "salsa", "aderezo", "vinagre", "mayonesa", "ketchup", "mostaza"]),
+    ("Bebidas Alcohólicas", ["vino", "cerveza", "pisco", "ron", "whisky", "vodka", "licor", "champaña"]),
+    ("Bebidas no Alcohólicas", ["agua", "soda", "jugo", "refresco", "gaseosa", "cola", "coca", "pepsi", "té", "café"]),
+    ("Aseo y Limpieza", ["jabón", "detergente", "cloro", "limpiador", "desinfectante", "escoba", "esponja", "lavaloza", "trapeador"]),
+    ("Higiene Personal", ["shampoo", "champú", "crema dental", "cepillo", "desodorante", "pañal", "toalla higiénica", "afeitar", "jabón corporal"]),
+    ("Mascotas", ["perro", "gato", "mascota", "alimento para perros", "alimento para gatos", "arena sanitaria", "hueso"]),
+    ("Bebé", ["leche infantil", "pañal", "bebé", "mamadera", "toallita húmeda"]),
+    ("Congelados", ["congelado", "helado", "hielo", "frozen", "sorbete"]),
+    ("Electrónicos y Tecnología", ["cable", "usb", "teléfono", "celular", "computador", "laptop", "batería", "cargador", "audífono"]),
+    ("Herramientas y Ferretería", ["clavo", "martillo", "serrucho", "tornillo", "destornillador", "llave", "taladro", "alicate"]),
+    ("Oficina y Papelería", ["cuaderno", "lápiz", "papel", "bolígrafo", "carpeta", "notebook", "impresora", "tinta"]),
+]
+# One compiled alternation per category: each product name is scanned once per
+# category by the regex engine instead of once per keyword.
+_CATEGORY_PATTERNS = [
+    (category, re.compile("|".join(map(re.escape, keywords))))
+    for category, keywords in PRODUCT_CATEGORIES
+]
+
+
+def classify_product(name: str) -> str:
+    """
+    Assign a product to one of several expanded categories based on keywords in its name.
+
+    The categories cover a broad range of grocery and general merchandise items. If none of the
+    keywords match, the product is assigned to "Otros".
+    """
+    return _classify_normalized(name.strip().lower())
+
+
+# Classification is pure and product names repeat across requests, so results
+# are memoized per normalized name: spellings differing only in case or
+# surrounding spaces share one entry
+@functools.lru_cache(maxsize=4096)
+def _classify_normalized(name: str) -> str:
+    """Classify an already lower-cased, stripped product name."""
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(name):
+            return category
+    return "Otros"
+
+
+@cached_call
+def _category_totals(
+    start: str | None, end: str | None, supplier: str | None
+) -> tuple[Dict[str, Dict[str, float]], Dict[str, str]]:
+    """Aggregate product totals per category.
+
+    Returns the per-category totals and the category assigned to each product.
+    Results are cached, so the categories endpoint and its Excel export share
+    one computation per filter set.
+    """
+    categories_summary: Dict[str, Dict[str, float]] = {}
+    product_categories: Dict[str, str] = {}
+    for prod, total_qty, total_value in _product_totals(start, end, supplier):
+        category = classify_product(prod)
+        product_categories[prod] = category
+        if category not in categories_summary:
+            categories_summary[category] = {"total_qty": 0.0, "total_value": 0.0}
+        categories_summary[category]["total_qty"] += float(total_qty or 0)
+        categories_summary[category]["total_value"] += float(total_value or 0)
+    return categories_summary, product_categories
+
+
 @app.route("/api/analytics/categories", methods=["GET"])
+@cached_view
 def categories_analytics() -> tuple[Dict[str, Any], int]:
     """
     Compute product categories and aggregate quantities and values per category.
@@ -936,89 +1686,9 @@ def categories_analytics() -> tuple[Dict[str, Any], int]:
     dictionary of categories with total quantity and total value, along with a
     mapping of each product name to its category.
     """
-    start_param = request.args.get("start")
-    end_param = request.args.get("end")
-    supplier_param = request.args.get("supplier")
-    # Base query
-    query = db.session.query(
-        Item.name.label("producto"),
-        db.func.sum(Item.quantity).label("total_qty"),
-        db.func.sum(Item.quantity * Item.price).label("total_value"),
-    ).join(Document, Document.id == Item.document_id)
-    # Date filters
-    if start_param:
-        try:
-            start_date = datetime.strptime(start_param, "%Y-%m").date()
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date >= start_date)
-        except Exception:
-            pass
-    if end_param:
-        try:
-            from calendar import monthrange
-            end_dt = datetime.strptime(end_param, "%Y-%m")
-            year, month = end_dt.year, end_dt.month
-            last_day = monthrange(year, month)[1]
-            end_date = datetime(year, month, last_day).date()
-            query = query.filter(Document.doc_date != None)
-            query = query.filter(Document.doc_date <= end_date)
-        except Exception:
-            pass
-    # Supplier filter
-    if supplier_param:
-        if supplier_param.isdigit():
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.id == int(supplier_param))
-        else:
-            query = query.join(Supplier, Supplier.id == Document.supplier_id)
-            query = query.filter(Supplier.name == supplier_param)
-    rows = query.group_by(Item.name).all()
-    def classify(name: str) -> str:
-        """
-        Assign a product to one of several expanded categories based on keywords in its name.
-
-        The categories cover a broad range of grocery and general merchandise items. If none of the
-        keywords match, the product is assigned to "Otros".
-        """
-        lower = name.lower()
-        # List of (category, [keywords]) tuples. Order matters: first match wins.
-        categories_keywords = [
-            ("Carnes", ["carne", "pollo", "vacuno", "res", "cerdo", "cordero", "jamón", "tocino", "salchicha"]),
-            ("Pescados y Mariscos", ["pescado", "marisco", "atún", "salmón", "camaron", "merluza", "ostión", "chorito"]),
-            ("Lácteos", ["queso", "leche", "yogur", "mantequilla", "crema", "manjar", "helado"]),
-            ("Frutas", ["manzana", "plátano", "banana", "pera", "uva", "fresa", "frutilla", "mora", "fruta", "kiwi", "naranja", "melón", "durazno", "sandía", "piña"]),
-            ("Verduras", ["tomate", "cebolla", "lechuga", "zanahoria", "papa", "verdura", "champiñón", "brocoli", "pimiento", "col", "espinaca", "berenjena", "zapallo", "pepino", "ajo"]),
-            ("Panadería y Pastelería", ["pan", "bolleria", "bollería", "croissant", "baguette", "empanada", "empanada de horno", "torta", "pastel", "gallet", "postre", "queque"]),
-            ("Snacks y Dulces", ["snack", "galleta", "chocolate", "dulce", "caramelo", "barra", "papas fritas", "chips", "maní", "nueces", "almendra"]),
-            ("Cereales y Granos", ["arroz", "frijol", "lenteja", "poroto", "garbanzo", "cereal", "avena"]),
-            ("Pastas y Harinas", ["pasta", "fideo", "harina", "spaghetti", "macarrón", "macarrones"]),
-            ("Aceites y Condimentos", ["aceite", "sal", "azúcar", "especia", "condimento", "salsa", "aderezo", "vinagre", "mayonesa", "ketchup", "mostaza"]),
-            ("Bebidas Alcohólicas", ["vino", "cerveza", "pisco", "ron", "whisky", "vodka", "licor", "champaña"]),
-            ("Bebidas no Alcohólicas", ["agua", "soda", "jugo", "refresco", "gaseosa", "cola", "coca", "pepsi", "té", "café"]),
-            ("Aseo y Limpieza", ["jabón", "detergente", "cloro", "limpiador", "desinfectante", "escoba", "esponja", "lavaloza", "trapeador"]),
-            ("Higiene Personal", ["shampoo", "champú", "crema dental", "cepillo", "desodorante", "pañal", "toalla higiénica", "afeitar", "jabón corporal"]),
-            ("Mascotas", ["perro", "gato", "mascota", "alimento para perros", "alimento para gatos", "arena sanitaria", "hueso"]),
-            ("Bebé", ["leche infantil", "pañal", "bebé", "mamadera", "toallita húmeda"]),
-            ("Congelados", ["congelado", "helado", "hielo", "frozen", "sorbete"]),
-            ("Electrónicos y Tecnología", ["cable", "usb", "teléfono", "celular", "computador", "laptop", "batería", "cargador", "audífono"]),
-            ("Herramientas y Ferretería", ["clavo", "martillo", "serrucho", "tornillo", "destornillador", "llave", "taladro", "alicate"]),
-            ("Oficina y Papelería", ["cuaderno", "lápiz", "papel", "bolígrafo", "carpeta", "notebook", "impresora", "tinta"]),
-            ("Otros", []),
-        ]
-        for category, keywords in categories_keywords[:-1]:
-            for kw in keywords:
-                if kw in lower:
-                    return category
-        return "Otros"
-    categories_summary: Dict[str, Dict[str, float]] = {}
-    product_categories: Dict[str, str] = {}
-    for prod, total_qty, total_value in rows:
-        category = classify(prod)
-        product_categories[prod] = category
-        if category not in categories_summary:
-            categories_summary[category] = {"total_qty": 0.0, "total_value": 0.0}
-        categories_summary[category]["total_qty"] += float(total_qty or 0)
-        categories_summary[category]["total_value"] += float(total_value or 0)
+    categories_summary, product_categories = _category_totals(
+        request.args.get("start"), request.args.get("end"), request.args.get("supplier")
+    )
     return {"categories": categories_summary, "products": product_categories}, 200
 
 
@@ -1035,33 +1705,20 @@ def export_categories_excel() -> Any:
     Returns:
         An Excel file for download.
     """
-    # Get categories data
-    data, status = categories_analytics()
-    categories_summary = data.get("categories", {})
-    # Build dataframe
-    records = []
-    for cat, stats in categories_summary.items():
-        records.append({
-            "Categoría": cat,
-            "Cantidad total": float(stats.get("total_qty", 0)),
-            "Valor total": float(stats.get("total_value", 0)),
-        })
-    df = pd.DataFrame(records)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output) as writer:
-        df.to_excel(writer, index=False, sheet_name="Categorias")
-    output.seek(0)
-    return (
-        output.getvalue(),
-        200,
-        {
-            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "Content-Disposition": "attachment; filename=categorias.xlsx",
-        },
+    categories_summary, _ = _category_totals(
+        request.args.get("start"), request.args.get("end"), request.args.get("supplier")
+    )
+    rows = (
+        (cat, float(stats.get("total_qty", 0)), float(stats.get("total_value", 0)))
+        for cat, stats in categories_summary.items()
+    )
+    return _xlsx_response(
+        "Categorias", ["Categoría", "Cantidad total", "Valor total"], rows, "categorias.xlsx"
     )
 
 
 @app.route("/api/analytics", methods=["GET"])
+@cached_view
 def analytics():
     """Compute and return aggregated analytics for suppliers, products and monthly quantities.
 
@@ -1070,75 +1727,94 @@ def analytics():
     """
     product_name = request.args.get("product")
     result: Dict[str, Any] = {}
+    if not _has_documents():
+        result = {"providers_usage": {}, "products_summary": {}, "monthly_quantities": {}}
+        if product_name:
+            result["product_monthly"] = {}
+        return result, 200
+    # Aggregate rows carry no entities, so they are read as plain mappings
+    # through Core select() instead of the ORM Query API.
     # Providers usage: count documents per supplier
-    provider_counts = (
-        db.session.query(Supplier.name, db.func.count(Document.id))
-        .join(Document, Supplier.id == Document.supplier_id)
-        .group_by(Supplier.id)
-        .all()
+    # Counted straight off the supplier_id index, then the few matching names
+    # are looked up, instead of joining suppliers into the scan
+    provider_counts = dict(
+        db.session.execute(
+            select(Document.supplier_id, db.func.count())
+            .where(Document.supplier_id != None)
+            .group_by(Document.supplier_id)
+        ).all()
     )
-    result["providers_usage"] = {name: count for name, count in provider_counts}
-    # Products summary: total quantity and price stats per product
-    product_stats = (
-        db.session.query(
-            Item.name,
-            db.func.count(Item.id).label("count_items"),
-            db.func.sum(Item.quantity).label("total_qty"),
-            db.func.min(Item.price).label("min_price"),
-            db.func.max(Item.price).label("max_price"),
-            db.func.avg(Item.price).label("avg_price"),
-        )
-        .group_by(Item.name)
-        .all()
+    supplier_names = dict(
+        db.session.execute(
+            select(Supplier.id, Supplier.name).where(Supplier.id.in_(provider_counts))
+        ).all()
     )
+    result["providers_usage"] = {
+        supplier_names[sid]: count for sid, count in provider_counts.items() if sid in supplier_names
+    }
+    # Products summary: total quantity and price stats per product, from the
+    # per-month rollup
+    product_stats = db.session.execute(
+        select(
+            ProductMonthStats.name.label("name"),
+            db.func.sum(ProductMonthStats.item_count).label("count_items"),
+            db.func.sum(ProductMonthStats.total_qty).label("total_qty"),
+            db.func.min(ProductMonthStats.min_price).label("min_price"),
+            db.func.max(ProductMonthStats.max_price).label("max_price"),
+            # NULL (shown as 0) when the product has no priced lines
+            (
+                db.func.sum(ProductMonthStats.price_sum)
+                / db.func.nullif(db.func.sum(ProductMonthStats.price_count), 0)
+            ).label("avg_price"),
+        ).group_by(ProductMonthStats.name)
+    ).mappings()
     result["products_summary"] = {
-        name: {
-            "count_items": count,
-            "total_qty": float(total_qty or 0),
-            "min_price": float(min_price or 0),
-            "max_price": float(max_price or 0),
-            "avg_price": float(avg_price or 0),
+        r["name"]: {
+            "count_items": r["count_items"],
+            "total_qty": float(r["total_qty"] or 0),
+            "min_price": float(r["min_price"] or 0),
+            "max_price": float(r["max_price"] or 0),
+            "avg_price": float(r["avg_price"] or 0),
         }
-        for name, count, total_qty, min_price, max_price, avg_price in product_stats
+        for r in product_stats
     }
     # Monthly quantities across all products
-    monthly_quantities = (
-        db.session.query(
-            db.func.strftime('%Y-%m', Document.doc_date).label("month"),
-            db.func.sum(Item.quantity).label("total_qty"),
+    monthly_quantities = db.session.execute(
+        select(
+            ProductMonthStats.doc_month.label("month"),
+            db.func.sum(ProductMonthStats.total_qty).label("total_qty"),
         )
-        .join(Item, Document.id == Item.document_id)
-        .filter(Document.doc_date != None)
-        .group_by("month")
-        .order_by("month")
-        .all()
-    )
-    result["monthly_quantities"] = {month: float(total_qty or 0) for month, total_qty in monthly_quantities}
-    # If product specified, compute monthly quantity and price stats for it
+        .where(ProductMonthStats.doc_month != "")
+        .group_by(ProductMonthStats.doc_month)
+        .order_by(ProductMonthStats.doc_month)
+    ).mappings()
+    result["monthly_quantities"] = {r["month"]: float(r["total_qty"] or 0) for r in monthly_quantities}
+    # If product specified, its monthly quantity and price stats are exactly
+    # its rollup rows
     if product_name:
-        product_monthly = (
-            db.session.query(
-                db.func.strftime('%Y-%m', Document.doc_date).label("month"),
-                db.func.sum(Item.quantity).label("total_qty"),
-                db.func.min(Item.price).label("min_price"),
-                db.func.max(Item.price).label("max_price"),
-                db.func.avg(Item.price).label("avg_price"),
+        product_monthly = db.session.execute(
+            select(
+                ProductMonthStats.doc_month.label("month"),
+                ProductMonthStats.total_qty,
+                ProductMonthStats.min_price,
+                ProductMonthStats.max_price,
+                (
+                    ProductMonthStats.price_sum
+                    / db.func.nullif(ProductMonthStats.price_count, 0)
+                ).label("avg_price"),
             )
-            .join(Item, Document.id == Item.document_id)
-            .filter(Item.name == product_name)
-            .filter(Document.doc_date != None)
-            .group_by("month")
-            .order_by("month")
-            .all()
-        )
+            .where(ProductMonthStats.name == product_name)
+            .where(ProductMonthStats.doc_month != "")
+            .order_by(ProductMonthStats.doc_month)
+        ).mappings()
         result["product_monthly"] = {
-            month: {
-                "total_qty": float(total_qty or 0),
-                "min_price": float(min_price or 0),
-                "max_price": float(max_price or 0),
-                "avg_price": float(avg_price or 0),
+            r["month"]: {
+                "total_qty": float(r["total_qty"] or 0),
+                "min_price": float(r["min_price"] or 0),
+                "max_price": float(r["max_price"] or 0),
+                "avg_price": float(r["avg_price"] or 0),
             }
-            for month, total_qty, min_price, max_price, avg_price in product_monthly
+            for r in product_monthly
         }
     return result, 200
 
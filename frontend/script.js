@@ -157,6 +157,39 @@ async function exportSelectedToCsv() {
   }
 }
 
+/**
+ * Download the PDF summaries of the selected documents as a single file.
+ */
+async function downloadSelectedPdfs() {
+  const checkboxes = document.querySelectorAll(".select-checkbox:checked");
+  const ids = Array.from(checkboxes).map((cb) => parseInt(cb.value));
+  if (!ids.length) {
+    alert("Seleccione al menos un documento");
+    return;
+  }
+  try {
+    const response = await fetch(`${API_BASE_URL}/documents/download_batch`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ ids }),
+    });
+    if (!response.ok) {
+      throw new Error("Error al generar el archivo PDF");
+    }
+    const blob = await response.blob();
+    const url = URL.createObjectURL(blob);
+    const link = document.createElement("a");
+    link.href = url;
+    link.download = "facturas_resumen.pdf";
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    URL.revokeObjectURL(url);
+  } catch (err) {
+    alert(err.message);
+  }
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   // Load existing documents
   loadDocuments();
@@ -170,6 +203,8 @@ document.addEventListener("DOMContentLoaded", () => {
   uploadForm.addEventListener("submit", handleUpload);
   // CSV export button for documents
   document.getElementById("exportCsvBtn").addEventListener("click", exportSelectedToCsv);
+  // Combined PDF summary of the selected documents
+  document.getElementById("exportPdfBtn").addEventListener("click", downloadSelectedPdfs);
   // Pagination controls
   document.getElementById("itemsPerPageSelect").addEventListener("change", (e) => {
     itemsPerPage = parseInt(e.target.value, 10) || 5;
@@ -467,9 +502,9 @@ async function loadDashboard() {
     const response = await fetch(`${API_BASE_URL}/dashboard`);
     const stats = await response.json();
     // Render chart of document types
-    renderDocTypeChart(stats.count_per_type);
-    // Render chart of file sizes distribution
-    renderFileSizeChart(stats.file_sizes);
+    renderDocTypeChart(stats.by_type);
+    // Render chart of file sizes distribution (bucketed by the backend)
+    renderFileSizeChart(stats.size_histogram);
     // Display average pages if available
     const avgPagesContainer = document.getElementById("avgPagesContainer");
     const avgPagesText = document.getElementById("avgPagesText");
@@ -908,12 +943,12 @@ function renderProductMonthlyChart(productName, monthlyData) {
 
 /**
  * Render a pie chart showing the number of documents per type.
- * @param {Object} countPerType
+ * @param {Array<{type: string, count: number, size: number}>} byType
  */
-function renderDocTypeChart(countPerType) {
+function renderDocTypeChart(byType) {
   const ctx = document.getElementById("docTypeChart").getContext("2d");
-  const labels = Object.keys(countPerType);
-  const data = Object.values(countPerType);
+  const labels = byType.map((entry) => entry.type);
+  const data = byType.map((entry) => entry.count);
   const chartTypeSelect = document.getElementById("docTypeChartType");
   const selectedType = chartTypeSelect.value || "pie";
   if (docTypeChart) {
@@ -954,27 +989,12 @@ function renderDocTypeChart(countPerType) {
 
 /**
  * Render a bar chart or histogram representing file sizes in KB.
- * @param {Array<number>} fileSizes Array of file sizes in bytes
+ * @param {Array<{label: string, count: number}>} sizeHistogram Document count per size bucket
  */
-function renderFileSizeChart(fileSizes) {
+function renderFileSizeChart(sizeHistogram) {
   const ctx = document.getElementById("fileSizeChart").getContext("2d");
-  // Convert sizes to KB and round
-  const sizesKB = fileSizes.map((size) => size / 1024);
-  // Determine bins for histogram (0-100KB, 100-500KB, 500-1000KB, >1000KB)
-  const bins = {
-    "0-100 KB": 0,
-    "100-500 KB": 0,
-    "500-1000 KB": 0,
-    ">1000 KB": 0,
-  };
-  sizesKB.forEach((size) => {
-    if (size <= 100) bins["0-100 KB"]++;
-    else if (size <= 500) bins["100-500 KB"]++;
-    else if (size <= 1000) bins["500-1000 KB"]++;
-    else bins[">1000 KB"]++;
-  });
-  const labels = Object.keys(bins);
-  const data = Object.values(bins);
+  const labels = sizeHistogram.map((bucket) => bucket.label);
+  const data = sizeHistogram.map((bucket) => bucket.count);
   if (fileSizeChart) {
     fileSizeChart.destroy();
   }